@@ -1,3 +1,4 @@
+from .env import *
 from .evaluator import *
 from .frame import *
 from .insts import *
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+from collections import ChainMap
+from logging import getLogger
+logger = getLogger(__name__)
+
+class Globals(dict):
+    # the top-level scope: answers the Env setters itself, so Setg/Setc
+    # need not check whether they run inside a function
+    __slots__ = ()
+    set_global = set_closure = dict.__setitem__
+
+class Env:
+    # one scope of a persistent environment: lookups fall through to
+    # parent, which is either another Env or the global mapping
+    __slots__ = ('locals', 'parent')
+    def __init__(self, locals=None, parent=None):
+        if locals is None:
+            locals = {}
+        if parent is None:
+            parent = {}
+        self.locals = locals
+        self.parent = parent
+    def __repr__(self):
+        return f'Env({self.locals!r}, parent={self.parent!r})'
+    def __getitem__(self, key):
+        env = self
+        while isinstance(env, Env):
+            if key in env.locals:
+                return env.locals[key]
+            env = env.parent
+        return env[key]
+    def __setitem__(self, key, value):
+        self.locals[key] = value
+    def set_closure(self, key, value):
+        self.closure[key] = value
+    def set_global(self, key, value):
+        self.globals[key] = value
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    @property
+    def maps(self):
+        maps, env = [], self
+        while isinstance(env, Env):
+            maps.append(env.locals)
+            env = env.parent
+        maps.append(env)
+        return maps
+    @property
+    def closure(self):
+        parent = self.parent
+        return parent.locals if isinstance(parent, Env) else parent
+    @property
+    def globals(self):
+        env = self.parent
+        while isinstance(env, Env):
+            env = env.parent
+        return env
+    # ChainMap view for code written against the old environments
+    def chainmap(self):
+        return ChainMap(*self.maps)
+    def __iter__(self):
+        return iter(self.chainmap())
+    def __len__(self):
+        return len(self.chainmap())
+    def items(self):
+        return self.chainmap().items()
+
+__all__ = [
+    'Globals',
+    'Env',
+]
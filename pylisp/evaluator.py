@@ -2,7 +2,7 @@
 from .frame import Frame, Stats
 
 from itertools import count
-from logging import getLogger
+from logging import getLogger, DEBUG
 logger = getLogger(__name__)
 
 def evaluate(insts, env=None):
@@ -13,6 +13,7 @@ def evaluate(insts, env=None):
     frames = [Frame(insts, env=env, stats=stats)]
     stats.num_frames += 1
     stats.max_frame_depth = max(stats.max_frame_depth, len(frames))
+    debugging = logger.isEnabledFor(DEBUG)
     for step in count(start=1):
         if not frames:
             break
@@ -25,16 +26,17 @@ def evaluate(insts, env=None):
 
         try:
             f = frames[-1]
-            logger.debug('step             = %r', step)
-            logger.debug('frame            = %s', hex(id(f)))
-            logger.debug('pc               = %r', f.pc)
-            logger.debug('inst             = %r', inst)
-            logger.debug('#insts           = %r', len(f.insts))
-            logger.debug('insts[pc-5:pc+5] = %r', f.insts[f.pc-5:f.pc+5])
-            logger.debug('insts            = %r', f.insts)
-            logger.debug('env              = %r', f.env)
-            logger.debug('stack            = %r', f.stack)
-            frames[-1].stats.num_insts += 1
+            if debugging:
+                logger.debug('step             = %r', step)
+                logger.debug('frame            = %s', hex(id(f)))
+                logger.debug('pc               = %r', f.pc)
+                logger.debug('inst             = %r', inst)
+                logger.debug('#insts           = %r', len(f.insts))
+                logger.debug('insts[pc-5:pc+5] = %r', f.insts[f.pc-5:f.pc+5])
+                logger.debug('insts            = %r', f.insts)
+                logger.debug('env              = %r', f.env)
+                logger.debug('stack            = %r', f.stack)
+            f.stats.num_insts += 1
             inst(frames)
         except Exception as e:
             logger.critical('error = %r', e)
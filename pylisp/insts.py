@@ -256,7 +256,7 @@ class Evaluate(Inst):
     def __call__(self, frames):
         frame = frames[-1]
         suite = frame.pop()
-        insts = list(suite)
+        insts = suite.compile()
         # NOTE: use PushRawFunc instead of recurisve call to evaluate
         #       otherwise we will blow up Python functional call stack
         #       evaluation of bytecode should only use frames object
@@ -1,26 +1,36 @@
 #!/usr/bin/env python3
+from .env import Env, Globals
 from .insts import *
 from .parser import parse
 
 from re import compile, escape
 from decimal import Decimal
-from textwrap import indent, dedent
-from collections import defaultdict, Iterable, ChainMap
+from collections import defaultdict
 from functools import wraps
 from itertools import count
 from copy import deepcopy
-from logging import getLogger
+from logging import getLogger, DEBUG
 from pprint import pformat
 from ast import literal_eval
 from enum import Enum, auto
-from sys import stdin
+from sys import stdin, intern
 logger = getLogger(__name__)
 
+NUM_RE = compile(r'^[+-]?(?:\d+\.?\d*|\.\d+)$')
+
+# parse numeric literals as Decimal instead of int/float
+__decimal__ = False
+
 # NOT thread-safe!!
 depth = 0
 max_depth = 30
 max_length = len('Comment')
-stats = {'func-calls': defaultdict(int), 'ufunc-calls': defaultdict(int)}
+template = f'%-{max_depth}s:%-{max_length}s:env = %r'
+generation = 0 # bumped by every Node.replace
+_label_counter = count() # While/IfElse jump labels
+_STATS_ON = False
+stats = {'func-calls': defaultdict(int), 'ufunc-calls': defaultdict(int),
+         'constant-folds': defaultdict(int)}
 def print_stats():
     if stats['func-calls']:
         print('Function Calls')
@@ -34,112 +44,145 @@ def print_stats():
         width = max(len(str(x)) for x in stats['ufunc-calls'])
         for obj, count in sorted(stats['ufunc-calls'].items()):
             print(f'\t{obj:<{width}} = {count}')
+    if stats['constant-folds']:
+        print('Constant Folds')
+        print('--------------')
+        width = max(len(str(x)) for x in stats['constant-folds'])
+        for cls, count in sorted(stats['constant-folds'].items()):
+            print(f'\t{cls:<{width}} = {count}')
 def debug(f):
     @wraps(f)
     def inner(self, env):
+        if not _STATS_ON and not logger.isEnabledFor(DEBUG):
+            return f(self, env)
         global depth
+        name = type(self).__name__
         call_indent = '  ' * depth
-        template = f'%-{max_depth}s:%-{max_length}s:env = %r'
-        logger.debug(template, f'{call_indent}enter', type(self).__name__, env)
+        logger.debug(template, f'{call_indent}enter', name, env)
         depth += 1
-        stats['func-calls'][type(self).__name__] += 1
-        if isinstance(self, UfuncBase):
-            for key, val in env.items():
-                if val is type(self):
-                    stats['ufunc-calls'][key] += 1
+        if _STATS_ON:
+            stats['func-calls'][name] += 1
+            if isinstance(self, UfuncBase):
+                stats['ufunc-calls'][self.__ufunc_name__] += 1
         rv = f(self, env)
         depth -= 1
-        logger.debug(template, f'{call_indent}leave', type(self).__name__, env)
+        logger.debug(template, f'{call_indent}leave', name, env)
         return rv
     return inner
 
 class Node:
+    _calls, _bound = (), None
+    _insts, _compiled = None, None
+    # True for nodes no pass ever rewrites in place, so copies can share them
+    _IMMUTABLE = False
     def __init__(self, *children):
         self.children = children
     def __repr__(self):
         return f'{type(self).__name__}({", ".join(repr(x) for x in self.children)})'
     def __deepcopy__(self, memo=None):
+        if self._IMMUTABLE:
+            return self
         return type(self)(*deepcopy(self.children, memo))
     def replace(self, node):
+        global generation
         self.__class__ = node.__class__
-        self.children = node.children
+        self.__dict__ = vars(node).copy()
+        generation += 1
+    def bind_calls(self):
+        # replace() may swap a child's class, so the bound methods are
+        # re-taken whenever any node has been replaced since the last bind
+        self._calls = tuple(child.__call__ for child in self.children)
+        self._bound = generation
+        return self._calls
     def pformat(self, level=0):
-        if not self.children:
-            return f'{type(self).__name__}()'
-        if len(self.children) == 1:
-            child = self.children[0]
-            child = child.pformat() if isinstance(child, Node) else repr(child)
-            pfx = '\t' * level
-            return indent(f'{type(self).__name__}({child})', prefix=pfx)
-        sep, pfx = ',\n', '\t' * level
-        children = [x.pformat(level=1) if isinstance(x, Node) else pfx + repr(x) for x in self.children]
-        msg = f'{type(self).__name__}(\n{sep.join(children)}\n)'
-        return indent(msg, prefix=pfx)
+        buf = []
+        self._pformat(level, '', buf)
+        return ''.join(buf)
+    def _pformat(self, level, prefix, buf, inline=False):
+        # prefix is what every line of this node starts with; an inline
+        # node continues its parent's line, so its first line has none
+        name, children = type(self).__name__, self.children
+        if not children:
+            if not inline:
+                buf.append(prefix)
+            buf.append(f'{name}()')
+            return
+        prefix += '\t' * level
+        if not inline:
+            buf.append(prefix)
+        if len(children) == 1:
+            child = children[0]
+            buf.append(f'{name}(')
+            if isinstance(child, Node):
+                child._pformat(0, prefix, buf, inline=True)
+            else:
+                buf.append(repr(child))
+            buf.append(')')
+            return
+        buf.append(f'{name}(\n')
+        for idx, child in enumerate(children):
+            if idx:
+                buf.append(',\n')
+            if isinstance(child, Node):
+                child._pformat(1, prefix, buf)
+            else:
+                buf.append(prefix + '\t' * level + repr(child))
+        buf.append(f'\n{prefix})')
     def __call__(self, env):
         raise NotImplementedError()
     def __iter__(self):
         yield Missing(self)
+    def compile(self):
+        # the flattened bytecode, reused until any node is replace()d
+        if self._compiled != generation:
+            self._insts = list(self)
+            self._compiled = generation
+        return self._insts
+    def fold(self):
+        # fold bottom-up; returns the node the parent should hold instead
+        # of self, so folding to a shared node like Nil keeps its identity
+        children = self.children
+        folded = tuple(x.fold() if isinstance(x, Node) else x for x in children)
+        if any(new is not old for new, old in zip(folded, children)):
+            self.set_children(folded)
+        return self
+    def fold_to(self, node):
+        if _STATS_ON:
+            stats['constant-folds'][type(self).__name__] += 1
+        return node
+    def set_children(self, children):
+        global generation
+        self.children = children
+        generation += 1
     @classmethod
     def parse(cls, tree):
-        NUM_RE = compile(r'(?:\+|-)?\d*\.?\d*')
         if not isinstance(tree, list):
-            if NUM_RE.fullmatch(tree):
-                return Atom(Decimal(tree))
+            if NUM_RE.match(tree):
+                if __decimal__:
+                    return Atom(Decimal(tree))
+                if '.' not in tree:
+                    return Atom(int(tree))
+                return Atom(float(tree))
             if tree.startswith('"') and tree.endswith('"'):
                 return Atom(literal_eval(tree))
             if tree == 'nil':
                 return Nil
             if tree == 'true':
                 return True_
-            return Var(tree)
+            return Var(intern(tree))
             if tree == 'false':
                 return False_
         if all(isinstance(x, list) for x in tree):
             return Suite.parse(tree)
-        if tree[0] == 'set':
-            return Set.parse(tree)
-        if tree[0] == 'setg':
-            return Setg.parse(tree)
-        if tree[0] == 'setc':
-            return Setc.parse(tree)
-        if tree[0] == 'ret':
-            return Ret.parse(tree)
-        if tree[0] == 'lambda':
-            return Lambda.parse(tree)
-        comparisons = {'==': Eq, '<>': Ne, '<': Lt, '>': Gt, '<=': Le, '>=': Ge,}
-        if tree[0] in comparisons:
-            return comparisons[tree[0]].parse(tree)
-        ops = {'+': {1: Pos, 2: Add},
-               '-': {1: Neg, 2: Sub},
-               '*': {2: Mul}, '/': {2: Div}, '%': {2: Mod}, '**': {2: Pow},
-               'and': {2: And}, 'or': {2: Or}, 'not': {1: Not}, 'xor': {2: Xor}}
-        if tree[0] in ops:
-            return ops[tree[0]][len(tree[1:])].parse(tree)
-        pyfuncs = {'print': Print, 'printf': Printf, 'printfs': Printfs, 'format': Format}
-        if tree[0] in pyfuncs:
-            return pyfuncs[tree[0]].parse(tree)
-        if tree[0] == 'assert':
-            return Assert.parse(tree)
-        if tree[0] == 'list':
-            return List.parse(tree)
-        if tree[0] == 'cons':
-            return Cons.parse(tree)
-        if tree[0] == 'car':
-            return Car.parse(tree)
-        if tree[0] == 'cdr':
-            return Cdr.parse(tree)
-        if tree[0] == 'if':
-            return IfElse.parse(tree)
-        if tree[0] == 'while':
-            return While.parse(tree)
-        if tree[0] == 'parse':
-            return Parse.parse(tree)
-        if tree[0] == 'quoted':
+        head = tree[0]
+        node = _HEAD_DISPATCH.get(head)
+        if node is not None:
+            return node.parse(tree)
+        arities = _OPS.get(head)
+        if arities is not None:
+            return arities[len(tree) - 1].parse(tree)
+        if head == 'quoted':
             return Atom(Node.parse(tree[1]))
-        if tree[0] == 'eval':
-            return Eval.parse(tree)
-        if tree[0] == 'read':
-            return Read.parse(tree)
         if len(tree) == 1:
             if tree[0].startswith('^'):
                 tree[0] = tree[0][1:]
@@ -151,15 +194,37 @@ class Node:
                     tree[0] = tree[0][1:]
                     return TailCall.parse(tree)
                 return Call.parse(tree)
-            return Var(tree[0])
+            return Var(intern(tree[0]))
         return NotImplemented.parse(tree)
 
+class Fields(Node):
+    # fixed-arity nodes keep each child in a named attribute listed in _FIELDS
+    _FIELDS = ()
+    def __init__(self, *children):
+        for field, child in zip(self._FIELDS, children):
+            setattr(self, field, child)
+    children = property(lambda self: tuple(getattr(self, f) for f in self._FIELDS))
+    def set_children(self, children):
+        global generation
+        for field, child in zip(self._FIELDS, children):
+            setattr(self, field, child)
+        generation += 1
+
+class Leaf(Fields):
+    # evaluates to itself; no @debug, since leaves are the most frequently
+    # evaluated nodes, but still counted when stats are on
+    def __call__(self, env):
+        if _STATS_ON:
+            stats['func-calls'][type(self).__name__] += 1
+        return self
+
 class NotImplemented(Node):
     @classmethod
     def parse(cls, tree):
         return cls(tree)
 
 class Comment(Node):
+    _IMMUTABLE = True
     @debug
     def __call__(self, env):
         return Nil
@@ -169,9 +234,20 @@ class Comment(Node):
 class Suite(Node):
     @debug
     def __call__(self, env):
+        calls = self._calls if self._bound == generation else self.bind_calls()
         rv = Nil
-        for child in self.children:
-            rv = child(env)
+        if type(env) is dict:
+            # a caller's plain mapping: run in a Globals copy of it and
+            # hand the bindings back afterwards
+            scope = Globals(env)
+            try:
+                for call in calls:
+                    rv = call(scope)
+            finally:
+                env.update(scope)
+            return rv
+        for call in calls:
+            rv = call(env)
         return rv
     @classmethod
     def parse(self, tree):
@@ -180,76 +256,73 @@ class Suite(Node):
         for child in self.children:
             yield from child
 
-class Set(Node):
+class Set(Fields):
     @debug
     def __call__(self, env):
         name, value = self.name(env), self.value(env)
+        if _STATS_ON:
+            name_ufunc(name.value, value)
         env[name.value] = value
         return value
     def __init__(self, name, value):
         super().__init__(name, value)
-    name  = property(lambda self: self.children[0])
-    value = property(lambda self: self.children[1])
+    _FIELDS = ('name', 'value')
     @classmethod
     def parse(cls, tree):
         _, name, value = tree
-        return cls(Name(name), Node.parse(value))
+        return cls(Name(intern(name)), Node.parse(value))
     def __iter__(self):
         yield from self.value
         yield PopVar(self.name.value)
         yield PushVar(self.name.value)
 
-class Setg(Node):
+class Setg(Fields):
     @debug
     def __call__(self, env):
         name, value = self.name(env), self.value(env)
-        if isinstance(env, ChainMap):
-            env.maps[-1][name.value] = value
-        else:
-            env[name.value] = value
+        if _STATS_ON:
+            name_ufunc(name.value, value)
+        env.set_global(name.value, value)
         return value
     def __init__(self, name, value):
         super().__init__(name, value)
-    name  = property(lambda self: self.children[0])
-    value = property(lambda self: self.children[1])
+    _FIELDS = ('name', 'value')
     @classmethod
     def parse(cls, tree):
         _, name, value = tree
-        return cls(Name(name), Node.parse(value))
+        return cls(Name(intern(name)), Node.parse(value))
     def __iter__(self):
         yield from self.value
         yield PopGlobalVar(self.name.value)
         yield PushGlobalVar(self.name.value)
 
-class Setc(Node):
+class Setc(Fields):
     @debug
     def __call__(self, env):
         name, value = self.name(env), self.value(env)
-        if isinstance(env, ChainMap):
-            env.maps[1][name.value] = value
-        else:
-            env[name.value] = value
+        if _STATS_ON:
+            name_ufunc(name.value, value)
+        env.set_closure(name.value, value)
         return value
     def __init__(self, name, value):
         super().__init__(name, value)
-    name  = property(lambda self: self.children[0])
-    value = property(lambda self: self.children[1])
+    _FIELDS = ('name', 'value')
     @classmethod
     def parse(cls, tree):
         _, name, value = tree
-        return cls(Name(name), Node.parse(value))
+        return cls(Name(intern(name)), Node.parse(value))
     def __iter__(self):
         yield from self.value
         yield PopClosureVar(self.name.value)
         yield PushClosureVar(self.name.value)
 
-class Ret(Node):
+class Ret(Fields):
     @debug
     def __call__(self, env):
         return self.value(env)
     def __init__(self, value):
         super().__init__(value)
-    value = property(lambda self: self.children[0])
+    _FIELDS = ('value',)
     @classmethod
     def parse(cls, tree):
         _, value = tree
@@ -261,12 +334,8 @@ class Ret(Node):
 class List(Node):
     @debug
     def __call__(self, env):
-        values = [val(env) for val in self.values]
-        values.reverse()
-        rv = Cell(values[0], Nil)
-        for v in values[1:]:
-            rv = Cell(v, rv)
-        return rv
+        calls = self._calls if self._bound == generation else self.bind_calls()
+        return TupleList(tuple([call(env) for call in calls]))
     def __init__(self, car, *cdr):
         super().__init__(car, *cdr)
     values = property(lambda self: self.children)
@@ -288,6 +357,7 @@ class List(Node):
         yield CallPyFunc(self.build, len(self.values))
 
 class Params(Node):
+    _IMMUTABLE = True
     def __call__(self, env):
         return self
     def __init__(self, *params):
@@ -296,17 +366,16 @@ class Params(Node):
     value  = property(lambda self: self.params)
     @classmethod
     def parse(cls, tree):
-        return cls(*tree)
+        return cls(*[intern(x) for x in tree])
 
-class Cons(Node):
+class Cons(Fields):
     @debug
     def __call__(self, env):
         car, cdr = self.car(env), self.cdr(env)
         return Cell(car, cdr)
     def __init__(self, car, cdr):
         super().__init__(car, cdr)
-    car = property(lambda self: self.children[0])
-    cdr = property(lambda self: self.children[1])
+    _FIELDS = ('car', 'cdr')
     @classmethod
     def parse(cls, tree):
         _, car, cdr = tree
@@ -316,13 +385,13 @@ class Cons(Node):
         yield from self.car
         yield CallPyFunc(lambda car, cdr: (car, cdr), 2)
 
-class Car(Node):
+class Car(Fields):
     @debug
     def __call__(self, env):
         return self.cons(env).car
     def __init__(self, cons):
         super().__init__(cons)
-    cons = property(lambda self: self.children[0])
+    _FIELDS = ('cons',)
     @classmethod
     def parse(cls, tree):
         _, cons = tree
@@ -331,13 +400,13 @@ class Car(Node):
         yield from self.cons
         yield CallPyFunc(lambda x: x[0], 1)
 
-class Cdr(Node):
+class Cdr(Fields):
     @debug
     def __call__(self, env):
         return self.cons(env).cdr
     def __init__(self, cons):
         super().__init__(cons)
-    cons = property(lambda self: self.children[0])
+    _FIELDS = ('cons',)
     @classmethod
     def parse(cls, tree):
         _, cons = tree
@@ -346,16 +415,32 @@ class Cdr(Node):
         yield from self.cons
         yield CallPyFunc(lambda x: x[1], 1)
 
-class Cell(Node):
-    @debug
-    def __call__(self, env):
-        return self
+class Cell(Leaf):
     def __init__(self, car, cdr):
         super().__init__(car, cdr)
-    car   = property(lambda self: self.children[0])
-    cdr   = property(lambda self: self.children[1])
+    _FIELDS = ('car', 'cdr')
     value = property(lambda self: (self.car.value, self.cdr.value))
 
+class TupleList(Leaf):
+    # the cells of a (list ...) packed into one tuple; cdr shares the
+    # tuple and only moves the start offset
+    def __init__(self, items, start=0):
+        super().__init__(items, start)
+    _FIELDS = ('items', 'start')
+    car = property(lambda self: self.items[self.start])
+    @property
+    def cdr(self):
+        start = self.start + 1
+        if start < len(self.items):
+            return TupleList(self.items, start)
+        return Nil
+    @property
+    def value(self):
+        items, rv = self.items, None
+        for idx in range(len(items) - 1, self.start - 1, -1):
+            rv = items[idx].value, rv
+        return rv
+
 class ProgramError(Exception):
     pass
 
@@ -364,7 +449,7 @@ def check_assert(cond, msg):
         raise ProgramError(msg)
     return Nil
 
-class Assert(Node):
+class Assert(Fields):
     @debug
     def __call__(self, env):
         if not self.cond(env).value:
@@ -372,8 +457,7 @@ class Assert(Node):
         return Nil
     def __init__(self, cond, msg):
         super().__init__(cond, msg)
-    cond = property(lambda self: self.children[0])
-    msg  = property(lambda self: self.children[1])
+    _FIELDS = ('cond', 'msg')
     @classmethod
     def parse(cls, tree):
         _, cond, msg = tree
@@ -383,59 +467,73 @@ class Assert(Node):
         yield from self.cond
         yield CallPyFunc(check_assert, 2)
 
-def create_binop(name, op):
-    # XXX
-    code = dedent(f'''
-    def create_op(op):
-        class {name}(Node):
-            @debug
-            def __call__(self, env):
-                left, right = self.left(env), self.right(env)
-                left, right = left.value, right.value   # unwrap
-                return Atom(op(left, right)) # wrap
-            def __init__(self, left, right):
-                super().__init__(left, right)
-            left  = property(lambda self: self.children[0])
-            right = property(lambda self: self.children[1])
-            @classmethod
-            def parse(cls, tree):
-                _, left, right = tree
-                return cls(Node.parse(left), Node.parse(right))
-            def __iter__(self):
-                yield from self.right
-                yield from self.left
-                yield CallPyFunc(op, 2)
-        return {name}
-    ''')
-    ns = {}
-    exec(code, globals(), ns)
-    return ns['create_op'](op)
+class _BinOp(Fields):
+    op = None
+    foldable = staticmethod(lambda left, right: True)
+    @debug
+    def __call__(self, env):
+        left, right = self.left(env), self.right(env)
+        left, right = left.value, right.value   # unwrap
+        return Atom(self.op(left, right)) # wrap
+    def __init__(self, left, right):
+        super().__init__(left, right)
+    _FIELDS = ('left', 'right')
+    @classmethod
+    def parse(cls, tree):
+        _, left, right = tree
+        return cls(Node.parse(left), Node.parse(right))
+    def __iter__(self):
+        yield from self.right
+        yield from self.left
+        yield CallPyFunc(self.op, 2)
+    def fold(self):
+        super().fold()
+        if isinstance(self.left, Atom) and isinstance(self.right, Atom):
+            left, right = self.left.value, self.right.value
+            if not self.foldable(left, right):
+                return self
+            try:
+                value = self.op(left, right)
+            except Exception:
+                return self # e.g. (/ 1 0), left to fail at runtime
+            return self.fold_to(Atom(value))
+        return self
+
+class _UnOp(Fields):
+    op = None
+    @debug
+    def __call__(self, env):
+        arg = self.arg(env)
+        arg = arg.value   # unwrap
+        return Atom(self.op(arg)) # wrap
+    def __init__(self, arg):
+        super().__init__(arg)
+    _FIELDS = ('arg',)
+    @classmethod
+    def parse(cls, tree):
+        _, arg = tree
+        return cls(Node.parse(arg))
+    def __iter__(self):
+        yield from self.arg
+        yield CallPyFunc(self.op, 1)
+    def fold(self):
+        super().fold()
+        if isinstance(self.arg, Atom):
+            try:
+                value = self.op(self.arg.value)
+            except Exception:
+                return self
+            return self.fold_to(Atom(value))
+        return self
+
+def create_binop(name, op, foldable=None):
+    attrs = {'op': staticmethod(op)}
+    if foldable is not None:
+        attrs['foldable'] = staticmethod(foldable)
+    return type(name, (_BinOp,), attrs)
 
 def create_unop(name, op):
-    # XXX
-    code = dedent(f'''
-    def create_op(op):
-        class {name}(Node):
-            @debug
-            def __call__(self, env):
-                arg = self.arg(env)
-                arg = arg.value   # unwrap
-                return Atom(op(arg)) # wrap
-            def __init__(self, arg):
-                super().__init__(arg)
-            arg  = property(lambda self: self.children[0])
-            @classmethod
-            def parse(cls, tree):
-                _, arg = tree
-                return cls(Node.parse(arg))
-            def __iter__(self):
-                yield from self.arg
-                yield CallPyFunc(op, 1)
-        return {name}
-    ''')
-    ns = {}
-    exec(code, globals(), ns)
-    return ns['create_op'](op)
+    return type(name, (_UnOp,), {'op': staticmethod(op)})
 
 from operator import pos, neg
 Pos = create_unop('Pos', pos)
@@ -451,13 +549,46 @@ Gt = create_binop('Gt', gt)
 Le = create_binop('Le', le)
 Ge = create_binop('Ge', ge)
 
-from operator import add, sub, mul, truediv, mod, pow
+from operator import add, sub, mul, truediv, pow
+from operator import mod as floor_mod
+def div(left, right):
+    # keep exact integer quotients integral, like Decimal did
+    if type(left) is int and type(right) is int and right and not left % right:
+        return left // right
+    return truediv(left, right)
+
+def mod(left, right):
+    # truncate like Decimal did, so the remainder takes the dividend's sign
+    rv = floor_mod(left, right)
+    if rv and type(left) in (int, float) and type(right) in (int, float) \
+        and (left < 0) != (right < 0):
+        rv -= right
+    return rv
+
+# size limits on folded results, the same ones CPython's constant folder uses
+MAX_FOLD_INT_BITS = 128
+MAX_FOLD_STR_SIZE = 4096
+
+def mul_foldable(left, right):
+    if isinstance(left, int) and isinstance(right, str):
+        left, right = right, left
+    if isinstance(left, str) and isinstance(right, int):
+        return len(left) * right <= MAX_FOLD_STR_SIZE
+    if isinstance(left, int) and isinstance(right, int):
+        return left.bit_length() + right.bit_length() <= MAX_FOLD_INT_BITS
+    return True
+
+def pow_foldable(left, right):
+    if isinstance(left, int) and isinstance(right, int) and right > 0:
+        return left.bit_length() * right <= MAX_FOLD_INT_BITS
+    return True
+
 Add = create_binop('Add', add)
 Sub = create_binop('Sub', sub)
-Mul = create_binop('Mul', mul)
-Div = create_binop('Div', truediv)
+Mul = create_binop('Mul', mul, mul_foldable)
+Div = create_binop('Div', div)
 Mod = create_binop('Mod', mod)
-Pow = create_binop('Pow', pow)
+Pow = create_binop('Pow', pow, pow_foldable)
 
 from operator import and_, or_, not_, xor, is_
 And = create_binop('And', and_)
@@ -468,52 +599,47 @@ Is  = create_binop('Is',  is_)
 
 BINOPS = Eq, Ne, Lt, Gt, Le, Ge, Add, Sub, Mul, Div, Mod, Pow, And, Or, Not, Xor, Is
 
+class _PyFunc(Node):
+    func = None
+    @debug
+    def __call__(self, env):
+        args = [arg(env) for arg in self.args]
+        args = [arg.value for arg in args] # unwrap
+        rv = self.func(*args)
+        return Atom(rv) # wrap
+    def __init__(self, *args):
+        super().__init__(*args)
+    args = property(lambda self: self.children)
+    @classmethod
+    def parse(cls, tree):
+        _, *args = tree
+        return cls(*[Node.parse(x) for x in args])
+    def __iter__(self):
+        for arg in reversed(self.args):
+            yield from arg
+        yield CallPyFunc(self.func, len(self.args))
+
 def create_pyfunc(name, func):
-    code = dedent(f'''
-    def create_func(func):
-        class {name}(Node):
-            @debug
-            def __call__(self, env):
-                args = [arg(env) for arg in self.args]
-                args = [arg.value for arg in args] # unwrap
-                rv = func(*args)
-                return Atom(rv) # wrap
-            def __init__(self, *args):
-                super().__init__(*args)
-            args = property(lambda self: self.children)
-            @classmethod
-            def parse(cls, tree):
-                _, *args = tree
-                return cls(*[Node.parse(x) for x in args])
-            def __iter__(self):
-                for arg in reversed(self.args):
-                    yield from arg
-                yield CallPyFunc(func, len(self.args))
-        return {name}
-    ''')
-    ns = {}
-    exec(code, globals(), ns)
-    return ns['create_func'](func)
+    return type(name, (_PyFunc,), {'func': staticmethod(func)})
 
 Print   = create_pyfunc('Print',   lambda *args: print(*args, flush=True))
 Format  = create_pyfunc('Format',  format)
 Printf  = create_pyfunc('Printf',  lambda fmt, *args:      print(fmt.format(*args), end='', flush=True))
 Printfs = create_pyfunc('Printfs', lambda fmt, sep, *args: print(fmt.format(*args), sep=sep, end='', flush=True))
 
-class Name(Node):
-    @debug
-    def __call__(self, env):
-        return self
+class Name(Leaf):
+    _IMMUTABLE = True
     def __init__(self, name):
         super().__init__(name)
-    name  = property(lambda self: self.children[0])
-    value = name
+    _FIELDS = ('name',)
+    value = property(lambda self: self.name)
     @classmethod
     def parse(cls, tree):
         name = tree[0] if isinstance(tree, list) else tree
-        return Name(name)
+        return Name(intern(name))
 
-class Var(Node):
+class Var(Fields):
+    _IMMUTABLE = True
     @debug
     def __call__(self, env):
         try:
@@ -522,21 +648,37 @@ class Var(Node):
             raise ProgramError(f'unknown name {self.name!r}') from e
     def __init__(self, name):
         super().__init__(name)
-    name = property(lambda self: self.children[0])
+    _FIELDS = ('name',)
     def __iter__(self):
         yield PushVar(self.name)
 
-class Atom(Node):
+class LocalVar(Var):
+    # parameter of the innermost enclosing lambda, bound in env.locals
+    # unless the call passed too few arguments
     @debug
     def __call__(self, env):
-        return self
+        try:
+            return env.locals[self.name](env)
+        except KeyError:
+            pass
+        try:
+            return env[self.name](env)
+        except KeyError as e:
+            raise ProgramError(f'unknown name {self.name!r}') from e
+
+class Atom(Leaf):
+    # quoted code is an ordinary tree the optimizer may rewrite
+    _IMMUTABLE = property(lambda self: not isinstance(self.value, Node))
     def __init__(self, value):
         super().__init__(value)
-    value = property(lambda self: self.children[0])
+    _FIELDS = ('value',)
     def __iter__(self):
         yield PushImm(self.value)
+    def fold(self):
+        return self # quoted code is left as written
 
 class Nil(Node):
+    _IMMUTABLE = True
     def __call__(self, env):
         return self
     value = property(lambda self: None)
@@ -545,6 +687,7 @@ class Nil(Node):
 Nil = Nil()
 
 class True_(Node):
+    _IMMUTABLE = True
     def __call__(self, env):
         return self
     value = property(lambda self: True)
@@ -553,6 +696,7 @@ class True_(Node):
 True_ = True_()
 
 class False_(Node):
+    _IMMUTABLE = True
     def __call__(self, env):
         return self
     value = property(lambda self: False)
@@ -560,17 +704,17 @@ class False_(Node):
         yield PushImm(self.value)
 False_ = False_()
 
-class While(Node):
+class While(Fields):
     @debug
     def __call__(self, env):
-        rv = Nil
-        while self.cond(env).value:
-            rv = self.body(env)
+        rv, cond, body = Nil, self.cond, self.body
+        while cond(env).value:
+            rv = body(env)
         return rv
     def __init__(self, cond, body):
         super().__init__(cond, body)
-    cond = property(lambda self: self.children[0])
-    body = property(lambda self: self.children[1])
+        self._lbl = next(_label_counter)
+    _FIELDS = ('cond', 'body')
     @classmethod
     def parse(cls, tree):
         _, cond, *body = tree
@@ -578,7 +722,7 @@ class While(Node):
             return cls(Node.parse(cond), Suite.parse(body))
         return cls(Node.parse(cond), Node.parse(*body))
     def __iter__(self):
-        start, end = f'loop-start-{hex(id(self))}', f'loop-end-{hex(id(self))}'
+        start, end = self._lbl * 2, self._lbl * 2 + 1
         yield Label(start)
         yield from self.cond
         yield JumpIfFalse(end)
@@ -586,7 +730,7 @@ class While(Node):
         yield JumpAlways(start)
         yield Label(end)
 
-class IfElse(Node):
+class IfElse(Fields):
     @debug
     def __call__(self, env):
         rv = Nil
@@ -598,9 +742,8 @@ class IfElse(Node):
         return rv
     def __init__(self, cond, ifbody, elsebody=None):
         super().__init__(cond, ifbody, elsebody)
-    cond     = property(lambda self: self.children[0])
-    ifbody   = property(lambda self: self.children[1])
-    elsebody = property(lambda self: self.children[2])
+        self._lbl = next(_label_counter)
+    _FIELDS = ('cond', 'ifbody', 'elsebody')
     @classmethod
     def parse(cls, tree):
         _, cond, ifbody, *elsebody = tree
@@ -608,7 +751,7 @@ class IfElse(Node):
             return cls(Node.parse(cond), Node.parse(ifbody), Node.parse(*elsebody))
         return cls(Node.parse(cond), Node.parse(ifbody))
     def __iter__(self):
-        ifbody, elsebody, end = f'ifbody-{hex(id(self))}', f'elsebody-{hex(id(self))}', f'end-{hex(id(self))}'
+        elsebody, end = self._lbl * 2, self._lbl * 2 + 1
         yield from self.cond
         if self.elsebody:
             yield JumpIfFalse(elsebody)
@@ -620,38 +763,78 @@ class IfElse(Node):
             yield Label(elsebody)
             yield from self.elsebody
         yield Label(end)
+    def fold(self):
+        super().fold()
+        cond = self.cond
+        if isinstance(cond, Atom) or cond is Nil or cond is True_ or cond is False_:
+            if cond.value:
+                return self.fold_to(self.ifbody)
+            return self.fold_to(self.elsebody or Nil)
+        return self
+
+class Thunk:
+    # a pending tail call, run by the nearest enclosing Call
+    __slots__ = ('func', 'env')
+    def __init__(self, func, env):
+        self.func, self.env = func, env
+    def __repr__(self):
+        return f'Thunk({self.func!r}, {self.env!r})'
+
+def trampoline(rv):
+    while isinstance(rv, Thunk):
+        rv = rv.func(rv.env)
+    return rv
 
 class Call(Node):
     @debug
     def __call__(self, env):
+        return trampoline(self.prepare(env)(env))
+    def prepare(self, env):
         args = [arg(env) for arg in self.args]
         try:
-            node = env[self.name.value](*args)
+            return env[self.name.value](*args)
         except KeyError as e:
             raise ProgramError(f'unknown name {self.name.value!r}') from e
-        return node(env)
     def __init__(self, name, *args):
-        super().__init__(name, *args)
-    name = property(lambda self: self.children[0])
-    args = property(lambda self: self.children[1:])
+        self.name, self.args = name, args
+    children = property(lambda self: (self.name, *self.args))
+    def set_children(self, children):
+        global generation
+        self.name, *args = children
+        self.args = tuple(args)
+        generation += 1
     @classmethod
     def parse(cls, tree):
         name, *args = tree
-        return cls(Name(name), *[Node.parse(x) for x in args])
+        return cls(Name(intern(name)), *[Node.parse(x) for x in args])
     def __iter__(self):
         for arg in reversed(self.args):
             yield from arg
         yield PushFunc(self.name.value)
 
 class TailCall(Call):
+    # evaluated like a Call unless mark_tail_position() promoted it
     def __iter__(self):
         for arg in reversed(self.args):
             yield from arg
         yield PushTailFunc(self.name.value)
 
+class TailPositionCall(TailCall):
+    # its value is the enclosing function's result, so the thunk is
+    # handed back to the Call that invoked that function
+    @debug
+    def __call__(self, env):
+        return Thunk(self.prepare(env), env)
+
 class UfuncBase(Node):
     # XXX
-    pass
+    __ufunc_name__ = '<lambda>'
+
+def name_ufunc(name, value):
+    # Lambda evaluates to a Ufunc class; record the name it was last bound
+    # to, for the stats report only
+    if isinstance(value, type) and issubclass(value, UfuncBase):
+        value.__ufunc_name__ = name
 
 class Scoping(Enum):
     DYNAMIC = auto()
@@ -659,39 +842,66 @@ class Scoping(Enum):
 
 __scoping__ = Scoping.LEXICAL
 
-class Lambda(Node):
+class Lambda(Fields):
     @debug
     def __call__(self, env):
-        params, body = self.params, self.body
-        if isinstance(env, ChainMap):
-            closures = env.maps[:-1]
-        else:
-            closures = []
+        names, body, closure = tuple(self.params.value), self.body, env
         class Ufunc(UfuncBase):
             @debug
             def __call__(self, env):
-                args = dict(zip(params.value, self.args))
-                if isinstance(env, ChainMap) and __scoping__ is Scoping.LEXICAL:
-                    local_env = ChainMap(args, *closures, env.maps[-1])
-                else:
-                    local_env = ChainMap(args, *closures, env)
-                return body(local_env)
+                args = dict(zip(names, self.args))
+                if __scoping__ is Scoping.LEXICAL:
+                    return body(Env(args, closure))
+                # dynamic: the captured scopes sit in front of the caller's
+                local_env = env
+                if isinstance(closure, Env):
+                    for scope in reversed(closure.maps[:-1]):
+                        local_env = Env(scope, local_env)
+                return body(Env(args, local_env))
             def __init__(self, *args):
-                super().__init__(*args)
-            args  = property(lambda self: self.children)
-            value = property(lambda self: self)
+                self.args = args
+            children = property(lambda self: self.args)
+            value    = property(lambda self: self)
         return Ufunc
     def __init__(self, params, body):
         super().__init__(params, body)
-    params = property(lambda self: self.children[0])
-    body   = property(lambda self: self.children[1])
+    _FIELDS = ('params', 'body')
     @classmethod
     def parse(cls, tree):
         _, params, body = tree
-        return cls(Params.parse(params), Node.parse(body))
+        params = Params.parse(params)
+        body = resolve_locals(Node.parse(body), params.params)
+        return cls(params, mark_tail_position(body))
     def __iter__(self):
         yield CreateFunc(self.params.value, self.body)
 
+def resolve_locals(node, params):
+    # nested lambdas resolve their own params, quoted code may run anywhere;
+    # returns the node the parent should hold, since a Var may be shared
+    if type(node) is Var and node.name in params:
+        return LocalVar(node.name)
+    if isinstance(node, Node) and not isinstance(node, (Atom, Lambda)):
+        children = node.children
+        resolved = tuple(resolve_locals(x, params) for x in children)
+        if any(new is not old for new, old in zip(resolved, children)):
+            node.set_children(resolved)
+    return node
+
+def mark_tail_position(node):
+    # only a function body's result value is a tail position; Ret does not
+    # return early, so a Suite's earlier children are not
+    if type(node) is TailCall:
+        node.replace(TailPositionCall(*node.children))
+    elif isinstance(node, Suite) and node.children:
+        mark_tail_position(node.children[-1])
+    elif isinstance(node, Ret):
+        mark_tail_position(node.value)
+    elif isinstance(node, IfElse):
+        mark_tail_position(node.ifbody)
+        if node.elsebody:
+            mark_tail_position(node.elsebody)
+    return node
+
 class Read(Node):
     @debug
     def __call__(self, env):
@@ -707,7 +917,7 @@ class Read(Node):
     def __iter__(self):
         yield ReadInput()
 
-class Parse(Node):
+class Parse(Fields):
     @debug
     def __call__(self, env):
         expr = self.expr
@@ -716,7 +926,7 @@ class Parse(Node):
         return Atom(node)
     def __init__(self, expr):
         super().__init__(expr)
-    expr = property(lambda self: self.children[0])
+    _FIELDS = ('expr',)
     @classmethod
     def parse(cls, tree):
         _, expr = tree
@@ -725,7 +935,7 @@ class Parse(Node):
         yield from self.expr
         yield CallPyFunc(parse, 1)
 
-class Eval(Node):
+class Eval(Fields):
     @debug
     def __call__(self, env):
         expr = self.expr
@@ -733,7 +943,7 @@ class Eval(Node):
         return node(env)
     def __init__(self, expr):
         super().__init__(expr)
-    expr = property(lambda self: self.children[0])
+    _FIELDS = ('expr',)
     @classmethod
     def parse(cls, tree):
         _, expr = tree
@@ -742,14 +952,31 @@ class Eval(Node):
         yield from self.expr
         yield Evaluate()
 
+_COMPARISONS = {'==': Eq, '<>': Ne, '<': Lt, '>': Gt, '<=': Le, '>=': Ge}
+_PYFUNCS = {'print': Print, 'printf': Printf, 'printfs': Printfs, 'format': Format}
+# head symbol -> {number of operands: node class}
+_OPS = {'+': {1: Pos, 2: Add},
+        '-': {1: Neg, 2: Sub},
+        '*': {2: Mul}, '/': {2: Div}, '%': {2: Mod}, '**': {2: Pow},
+        'and': {2: And}, 'or': {2: Or}, 'not': {1: Not}, 'xor': {2: Xor}}
+
+# head symbol -> node class, consulted by Node.parse
+_HEAD_DISPATCH = {
+    'set': Set, 'setg': Setg, 'setc': Setc, 'ret': Ret, 'lambda': Lambda,
+    **_COMPARISONS,
+    **_PYFUNCS,
+    'assert': Assert, 'list': List, 'cons': Cons, 'car': Car, 'cdr': Cdr,
+    'if': IfElse, 'while': While, 'parse': Parse, 'eval': Eval, 'read': Read,
+}
+
 __all__ = [
-    'Node', 'NotImplemented', 'Comment', 'Suite', 'Set', 'Setg', 'Setc',
-    'Ret', 'List', 'Params', 'Cons', 'Car', 'Cdr', 'Cell', 'ProgramError',
+    'Node', 'Fields', 'Leaf', 'NotImplemented', 'Comment', 'Suite', 'Set', 'Setg', 'Setc',
+    'Ret', 'List', 'Params', 'Cons', 'Car', 'Cdr', 'Cell', 'TupleList', 'ProgramError',
     'Assert', 'Pos', 'Neg', 'Eq', 'Ne', 'Lt', 'Gt', 'Le', 'Ge', 'Add', 'Sub',
     'Mul', 'Div', 'Mod', 'Pow', 'And', 'Or', 'Not', 'Xor', 'Is',
     'Print', 'Format', 'Printf', 'Printfs', 'Name',
-    'Var', 'Atom', 'Nil', 'True_', 'False_', 'While', 'IfElse', 'Call',
-    'TailCall', 'UfuncBase', 'Scoping', 'Lambda', 'Read', 'Parse', 'Eval',
+    'Var', 'LocalVar', 'Atom', 'Nil', 'True_', 'False_', 'While', 'IfElse', 'Call',
+    'TailCall', 'TailPositionCall', 'UfuncBase', 'Scoping', 'Lambda', 'Read', 'Parse', 'Eval',
 
     'BINOPS', 'UNOPS',
 
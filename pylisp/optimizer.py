@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 from .nodes import *
+from .nodes import mark_tail_position
 from .insts import *
 
 from copy import deepcopy
@@ -19,25 +20,8 @@ def traverse(tree, func=None):
         yield from traverse(child, func)
 
 def constant_folding(tree):
-    tree = deepcopy(tree)
-    while True:
-        did_optimization = False
-        for node, _ in traverse(tree):
-            if isinstance(node, UNOPS) \
-                and not isinstance(node.arg, Var):
-                new_node = node(env={})
-                node.replace(new_node)
-                did_optimization = True
-        for node, _ in traverse(tree):
-            if isinstance(node, BINOPS) \
-                and not isinstance(node.left,  Var) \
-                and not isinstance(node.right, Var):
-                new_node = node(env={})
-                node.replace(new_node)
-                did_optimization = True
-        if not did_optimization:
-            break
-    return tree
+    # the same fold parse() already runs, for trees built or edited by hand
+    return deepcopy(tree).fold()
 
 def identify_tail_calls(tree):
     tree = deepcopy(tree)
@@ -49,6 +33,10 @@ def identify_tail_calls(tree):
             new_node = Ret(TailCall(*node.value.children))
             node.replace(new_node)
 
+    for node, _ in traverse(tree):
+        if isinstance(node, Lambda):
+            mark_tail_position(node.body)
+
     return tree
 
 def optimize_ast(tree, optimizations=(constant_folding, identify_tail_calls)):
@@ -46,7 +46,7 @@ def build_tree(tokens):
 
 def build_nodes(tree):
     from .nodes import Node
-    return Node.parse(tree)
+    return Node.parse(tree).fold()
 
 def build_ast(tokens):
     tree = build_tree(tokens)
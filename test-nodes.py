@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 from pylisp import *
 from textwrap import dedent
+from decimal import Decimal
 from operator import lt, add, mul
 from random import randint
 from io import StringIO
@@ -78,6 +79,13 @@ def test_arithmetic(x, y):
             ),
             Atom('(- (/ (* x (- 4 2)) (* y (+ 1 1)))) failed'),
         ),
+        Assert(
+            Eq(
+                Mod(Atom(-7), Atom(3)),
+                Atom(-1),
+            ),
+            Atom('(% -7 3) failed'),
+        ),
         Print(
             Atom('All arithmetic tests passed!')
         ),
@@ -361,10 +369,67 @@ def test_scoping():
         (printf "outside  - after  - x = {:5f}, y = {:5f}\n" x y)
         (assert (and (== x 10) (== y 100)) "Scoping failed!")
 
+        (set w 5)
+        (set missing-arg (lambda (x w) ((ret w))))
+        (assert (== (missing-arg 1) 5) "missing argument lookup failed!")
+
         (print "All scoping tests passed!")
     '''
     return parse(code)
 
+def test_tailcalls():
+    code = r'''
+        (set count-down (lambda (n) (
+            (if (== n 0)
+                (ret "done")
+                (ret (^count-down (- n 1)))
+            )
+        )))
+        (set rv (count-down 5000))
+        (assert (== rv "done") "(count-down 5000) failed!")
+        (set rv (^count-down 10))
+        (assert (== rv "done") "(^count-down 10) failed!")
+
+        (set sum-to (lambda (n acc) (
+            (if (== n 0)
+                (ret acc)
+                (ret (sum-to (- n 1) (+ acc n)))
+            )
+        )))
+        (set rv (sum-to 5000 0))
+        (assert (== rv 12502500) "(sum-to 5000 0) failed!")
+
+        (set inc (lambda (n) ((ret (+ n 1)))))
+        (set non-tail (lambda (n) (
+            (set x (^inc n))
+            (set y (+ 1 (^inc x)))
+            (ret y)
+        )))
+        (set rv (non-tail 1))
+        (assert (== rv 4) "(non-tail 1) failed!")
+
+        (set calls 0)
+        (set count-call (lambda () ((setg calls (+ calls 1)))))
+        (set ret-first (lambda () (
+            (ret (^count-call))
+            (ret "after")
+        )))
+        (set rv (ret-first))
+        (assert (and (== calls 1) (== rv "after")) "(ret-first) failed!")
+
+        (set afters 0)
+        (set g (lambda (n) (
+            (if (> n 0) (ret (g (- n 1))))
+            (setg afters (+ afters 1))
+            (ret n)
+        )))
+        (g 2)
+        (assert (== afters 3) "(g 2) failed!")
+
+        (print "All tail call tests passed!")
+    '''
+    return optimize_ast(parse(code))
+
 def test_bytecode():
     insts = [
         # x = 0
@@ -555,7 +620,9 @@ def test_bytecode2():
     import sys; old_stdout = sys.stdout; sys.stdout = buf
     evaluate(bytecodes)
     sys.stdout = old_stdout
-    expected = dedent('''
+    import pylisp.nodes as nodes
+    num = Decimal if nodes.__decimal__ else int
+    expected = dedent(f'''
         Bytecode test.
         x = 10, y = 100
         x = 9, y = 90
@@ -575,10 +642,10 @@ def test_bytecode2():
         (f2 10) -> 12
         (f3 10) -> 13
         Closure 2
-        (f11 10) -> (Decimal('1'), (Decimal('1'), (Decimal('10'), None)))
-        (f12 10) -> (Decimal('1'), (Decimal('2'), (Decimal('10'), None)))
-        (f21 10) -> (Decimal('2'), (Decimal('1'), (Decimal('10'), None)))
-        (f22 10) -> (Decimal('2'), (Decimal('2'), (Decimal('10'), None)))
+        (f11 10) -> {(num(1), (num(1), (num(10), None)))!r}
+        (f12 10) -> {(num(1), (num(2), (num(10), None)))!r}
+        (f21 10) -> {(num(2), (num(1), (num(10), None)))!r}
+        (f22 10) -> {(num(2), (num(2), (num(10), None)))!r}
     ''')
     if buf.getvalue().strip() != expected.strip():
         raise ProgramError('eval(...) failed!')
@@ -648,6 +715,37 @@ def test_bytecode3():
         raise ProgramError('Automatic TCO test failed!')
     print('Bytecode test #3 (tail calls) passed.')
 
+def test_folding():
+    suite = parse('(set x (- (* 2 (+ 3 4))))')
+    value = suite.children[0].value
+    if not isinstance(value, Atom) or value.value != -14:
+        raise ProgramError('Constant folding failed!')
+
+    suite = parse('(if nil (print "unreachable")) (if (> 2 1) (set x 1) (set x 2))')
+    if suite.children[0] is not Nil or not isinstance(suite.children[1], Set):
+        raise ProgramError('If-condition folding failed!')
+
+    suite = parse('(if (== 1 2) (print (** 10 3000000)))')
+    if suite.children[0] is not Nil:
+        raise ProgramError('Dead branch folding failed!')
+    if not isinstance(parse('(** 10 3000000)').children[0], Pow):
+        raise ProgramError('Oversized power was folded!')
+
+    suite = parse('(/ 1 0)')
+    if not isinstance(suite.children[0], Div):
+        raise ProgramError('(/ 1 0) was folded!')
+    try:
+        suite(env={})
+    except ZeroDivisionError:
+        pass
+    else:
+        raise ProgramError('(/ 1 0) did not fail at runtime!')
+
+    suite = constant_folding(Suite(Add(Atom(1), Atom(2))))
+    if not isinstance(suite.children[0], Atom) or suite.children[0].value != 3:
+        raise ProgramError('constant_folding failed!')
+    print('Constant folding test passed.')
+
 def test_optimizer():
     code = r'''
         (printf "(- (* 2 (+ 3 4))) = {}\n" (- (* 2 (+ 3 4))))
@@ -742,12 +840,17 @@ def test_functionality():
 parser = ArgumentParser()
 parser.add_argument('-v', '--verbose', action='count')
 parser.add_argument('-s', '--stats', action='store_true', default=False)
+parser.add_argument('--decimal', action='store_true', default=False)
 parser.add_argument('tests', nargs='*')
 
 if __name__ == '__main__':
     args = parser.parse_args()
     basicConfig(level={2: DEBUG, 1: INFO}.get(args.verbose, ERROR))
 
+    import pylisp.nodes as nodes
+    nodes._STATS_ON = args.stats
+    nodes.__decimal__ = args.decimal
+
     if 'cons' in args.tests or not args.tests:
         suite = test_cons()
         logger.info(f'suite = %s',           suite.pformat())
@@ -794,6 +897,11 @@ if __name__ == '__main__':
         logger.info(f'suite = %s',           suite.pformat())
         logger.info(f'suite(env={{}}) = %r', suite(env={}))
 
+    if 'tailcalls' in args.tests or not args.tests:
+        suite = test_tailcalls()
+        logger.info(f'suite = %s',           suite.pformat())
+        logger.info(f'suite(env={{}}) = %r', suite(env={}))
+
     if 'bytecode' in args.tests or not args.tests:
         test_bytecode()
 
@@ -806,10 +914,13 @@ if __name__ == '__main__':
     if 'optimizer' in args.tests or not args.tests:
         test_optimizer()
 
+    if 'folding' in args.tests or not args.tests:
+        test_folding()
+
     if 'functionality' in args.tests or not args.tests:
         test_functionality()
 
     print('All tests passed!')
 
     if args.stats:
-        print_stats()
+        nodes.print_stats()